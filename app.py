@@ -2,17 +2,19 @@ import streamlit as st
 import pandas as pd
 import firebase_admin
 from firebase_admin import credentials, auth, firestore
-from utils import compute_grade_boundaries, validate_boundaries, plot_grade_distribution, clean_data
+from utils import compute_auto_boundaries, apply_boundaries, validate_boundaries, compute_statistics, marks_histogram, count_grades, plot_grade_distribution, export_csv, clean_data
 import streamlit_authenticator as stauth
 import plotly.express as px
 import os
+import io
 import json
+import hashlib
 
 # Global authenticator instance
 authenticator = None
 
-# Initialize Firebase
-def init_firebase():
+# Initialize the Firebase app from local or environment credentials
+def init_firebase_app():
     if not firebase_admin._apps:
         # Load Firebase credentials from a file or environment variable
         cred_path = 'grading-app-adcb5-firebase-adminsdk-fbsvc-0cd897b47a.json'  # Local testing
@@ -22,32 +24,90 @@ def init_firebase():
         else:
             cred = credentials.Certificate(cred_path)
         firebase_admin.initialize_app(cred)
+
+# Shared Firestore client (one per process)
+@st.cache_resource
+def get_db():
+    init_firebase_app()
     return firestore.client()
 
-# Load users from Firestore for streamlit-authenticator
-def load_users():
-    db = init_firebase()
+# Seed initial users if none exist (checked once per process)
+@st.cache_resource
+def seed_users():
+    db = get_db()
     users_ref = db.collection('users')
-    users = users_ref.get()
-    user_dict = {}
-    for user in users:
-        data = user.to_dict()
-        # Use Firebase UID as key, but map to username for compatibility
-        user_dict[data['username']] = {
-            'email': data['email'],
-            'name': data['name'],
-            'password': data['password']  # Plain text for simplicity; Firebase Auth handles security
-        }
-    # Seed initial users if none exist
-    if not user_dict:
+    if not users_ref.limit(1).get():
         initial_users = [
             {'username': 'user1', 'email': 'user1@example.com', 'name': 'User One', 'password': 'abc123'},
             {'username': 'user2', 'email': 'user2@example.com', 'name': 'User Two', 'password': 'xyz789'}
         ]
-        for user in initial_users:
-            users_ref.document(user['username']).set(user)
-            user_dict[user['username']] = user
-    return user_dict
+        # Firestore batches hold at most 500 writes
+        for i in range(0, len(initial_users), 500):
+            batch = db.batch()
+            for user in initial_users[i:i + 500]:
+                batch.set(users_ref.document(user['username']),
+                          {**user, 'password': stauth.Hasher.hash(user['password'])})
+            batch.commit()
+
+# Normalise a username the way streamlit-authenticator does before its credential lookup
+def normalize_username(username):
+    return username.strip().lower()
+
+# Usernames double as Firestore document IDs, so they must be a single non-empty path segment
+def is_valid_username(username):
+    return bool(username) and '/' not in username and username not in ('.', '..')
+
+# Fetch a single user document by username; returns None if it doesn't exist
+def load_user(username):
+    if not is_valid_username(username):
+        return None
+    db = get_db()
+    # Only fetch the fields streamlit-authenticator needs
+    user = db.collection('users').document(username).get(field_paths=['email', 'name', 'password'])
+    if not user.exists:
+        return None
+    data = user.to_dict()
+    return {
+        'email': data['email'],
+        'name': data['name'],
+        'password': data['password']  # bcrypt hash; older documents may still hold plain text
+    }
+
+# Credentials dict that resolves users from Firestore on first lookup instead of preloading the collection
+class FirestoreUsers(dict):
+    def __missing__(self, username):
+        data = load_user(username)
+        if data is None:
+            raise KeyError(username)
+        # Passwords are hashed on write; hash any legacy plain-text row once and store it back
+        if not stauth.Hasher.is_hash(data['password']):
+            data['password'] = stauth.Hasher.hash(data['password'])
+            get_db().collection('users').document(username).update({'password': data['password']})
+        self[username] = data
+        return data
+
+    def __contains__(self, username):
+        try:
+            self[username]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, username, default=None):
+        return self[username] if username in self else default
+
+# Load users for streamlit-authenticator; fetched users are kept for the rest of the session
+def load_users():
+    seed_users()
+    if 'users' not in st.session_state:
+        st.session_state['users'] = FirestoreUsers()
+    return st.session_state['users']
+
+# streamlit-authenticator replaces the credentials dict on init, so install the lazy one afterwards
+class FirestoreAuthenticate(stauth.Authenticate):
+    def __init__(self, users, *args, **kwargs):
+        super().__init__({'usernames': {}}, *args, **kwargs)
+        self.authentication_controller.authentication_model.credentials['usernames'] = users
 
 # Initialize authenticator
 def init_authenticator():
@@ -62,8 +122,8 @@ def init_authenticator():
         },
         'preauthorized': {'emails': [os.getenv('PREAUTHORIZED_EMAIL', 'admin@example.com')]}
     }
-    authenticator = stauth.Authenticate(
-        config['credentials'],
+    authenticator = FirestoreAuthenticate(
+        config['credentials']['usernames'],
         config['cookie']['name'],
         config['cookie']['key'],
         config['cookie']['expiry_days']
@@ -73,30 +133,73 @@ def init_authenticator():
 # Signup function
 def signup():
     st.subheader("Sign Up")
-    new_username = st.text_input("New Username")
+    new_username = normalize_username(st.text_input("New Username"))
     new_password = st.text_input("New Password", type="password")
     new_email = st.text_input("Email")
     new_name = st.text_input("Full Name")
 
     if st.button("Register"):
-        db = init_firebase()
+        db = get_db()
         users_ref = db.collection('users')
+        if not is_valid_username(new_username):
+            st.error("Username can't be empty, '.', '..' or contain '/'.")
         # Check if username exists
-        if users_ref.document(new_username).get().exists:
+        elif users_ref.document(new_username).get().exists:
             st.error("Username already exists!")
         else:
-            # Store user in Firestore (password stored for streamlit-authenticator compatibility)
+            # Store user in Firestore with a bcrypt hash so logins only verify, never hash
             user_data = {
                 'username': new_username,
                 'email': new_email,
                 'name': new_name,
-                'password': new_password  # In production, rely on Firebase Auth instead
+                'password': stauth.Hasher.hash(new_password)
             }
             users_ref.document(new_username).set(user_data)
             st.success("Registration successful! Please log in.")
             st.session_state['page'] = 'login'
             st.rerun()
 
+# Parse and clean an upload once; reruns (and re-uploads of identical content) reuse the cached frame
+@st.cache_data
+def load_and_clean(_file_bytes, name, file_hash):
+    # pyarrow (CSV) and calamine (Excel) are native readers; every column is kept for the preview and download
+    file = io.BytesIO(_file_bytes)
+    df = pd.read_csv(file, engine='pyarrow') if name.endswith(".csv") else pd.read_excel(file, engine='calamine')
+    if 'marks' in df.columns:
+        df = clean_data(df)
+    return df
+
+# Auto boundaries only depend on the data and grade settings, so slider reruns reuse them
+@st.cache_data
+def auto_boundaries(_df, file_hash, grade_labels, grade_centric):
+    return compute_auto_boundaries(_df, grade_labels, grade_centric)
+
+# Statistics only depend on the marks, so grade or slider changes reuse them
+@st.cache_data
+def marks_statistics(_df, file_hash):
+    return compute_statistics(_df['marks'])
+
+# Distinct marks and their counts, so slider changes can regrade the histogram instead of every row
+@st.cache_data
+def marks_distribution(_df, file_hash):
+    return marks_histogram(_df['marks'])
+
+# Grades are fully determined by the file, labels and boundaries, so those key the cache instead of the frame;
+# every slider position adds an entry, so the caches are bounded
+@st.cache_data(max_entries=100, ttl=3600)
+def grade_distribution(_df, file_hash, grade_labels, boundaries):
+    values, counts = marks_distribution(_df, file_hash)
+    return count_grades(values, counts, grade_labels, boundaries)
+
+@st.cache_data(max_entries=50, ttl=3600)
+def grade_distribution_figure(_df, file_hash, grade_labels, boundaries, styled=True):
+    return plot_grade_distribution(grade_distribution(_df, file_hash, grade_labels, boundaries), styled)
+
+# Each entry holds a full copy of the CSV, so keep only a few recent downloads
+@st.cache_data(max_entries=5, ttl=600)
+def graded_csv(_df, file_hash, grade_labels, boundaries):
+    return export_csv(apply_boundaries(_df.copy(), grade_labels, boundaries))
+
 # Main app function
 def main_app():
     st.title("📊 AI-Powered Grade Moderation System")
@@ -123,19 +226,20 @@ def main_app():
     
     if uploaded_file:
         with st.spinner('Processing your data...'):
-            df = pd.read_csv(uploaded_file) if uploaded_file.name.endswith(".csv") else pd.read_excel(uploaded_file)
+            file_bytes = uploaded_file.getvalue()
+            file_hash = hashlib.blake2b(file_bytes).hexdigest()
+            df = load_and_clean(file_bytes, uploaded_file.name, file_hash)
             
             if 'marks' not in df.columns:
                 st.error("🚨 The uploaded file must contain a 'marks' column.")
                 return
             
-            df = clean_data(df)
             st.success("Data processed successfully!")
         
         tab1, tab2 = st.tabs(["Grading", "Statistics & Visualizations"])
         
         with tab1:
-            df, boundaries = compute_grade_boundaries(df, grade_labels, grade_centric)
+            boundaries = auto_boundaries(df, file_hash, grade_labels, grade_centric)
             
             st.sidebar.write("### ✏️ Adjust Grade Ranges (Manual Override)")
             manual_boundaries = {}
@@ -149,7 +253,7 @@ def main_app():
             if not validate_boundaries(grade_labels, manual_boundaries):
                 st.sidebar.error("🚨 Grade boundaries must be in descending order. Please adjust the sliders.")
             else:
-                df, boundaries = compute_grade_boundaries(df, grade_labels, grade_centric, manual_boundaries)
+                boundaries = manual_boundaries
                 
                 col1, col2 = st.columns(2)
                 with col1:
@@ -159,25 +263,20 @@ def main_app():
                 
                 with col2:
                     st.write("### 📊 Updated Grade Distribution")
-                    fig = plot_grade_distribution(df, grade_labels)
+                    fig = grade_distribution_figure(df, file_hash, grade_labels, boundaries)
                     st.plotly_chart(fig)
                 
                 st.write("### 📝 Updated Data Preview")
-                st.dataframe(df.head(20))
+                # Only the previewed rows are graded per rerun; the full file is graded when downloaded
+                st.dataframe(apply_boundaries(df.head(20).copy(), grade_labels, boundaries))
                 
-                csv = df.to_csv(index=False).encode('utf-8')
-                st.download_button("⬇️ Download Updated File", csv, "graded_students.csv", "text/csv")
+                st.download_button("⬇️ Download Updated File",
+                                   lambda: graded_csv(df, file_hash, grade_labels, boundaries),
+                                   "graded_students.csv", "text/csv")
         
         with tab2:
             st.write("### 📈 Statistics")
-            stats = {
-                "Mean": df['marks'].mean(),
-                "Median": df['marks'].median(),
-                "Mode": df['marks'].mode().values[0] if not df['marks'].mode().empty else "N/A",
-                "Standard Deviation": df['marks'].std(),
-                "Minimum": df['marks'].min(),
-                "Maximum": df['marks'].max(),
-            }
+            stats = marks_statistics(df, file_hash)
             stats_df = pd.DataFrame(list(stats.items()), columns=['Statistic', 'Value'])
             st.table(stats_df)
             
@@ -191,14 +290,8 @@ def main_app():
                 fig = px.box(df, y='marks', title='Box Plot of Marks')
                 st.plotly_chart(fig)
             elif plot_type == "Bar Chart":
-                if 'grade' in df.columns:
-                    grade_counts = df['grade'].value_counts().reindex(grade_labels, fill_value=0)
-                    fig = px.bar(x=grade_counts.index, y=grade_counts.values, 
-                                 labels={'x': 'Grades', 'y': 'Frequency'},
-                                 title='Grade Distribution')
-                    st.plotly_chart(fig)
-                else:
-                    st.write("Please assign grades in the 'Grading' tab to see the bar chart.")
+                fig = grade_distribution_figure(df, file_hash, grade_labels, boundaries, styled=False)
+                st.plotly_chart(fig)
 
 def main():
     global authenticator
@@ -233,7 +326,7 @@ def main():
 
                 if authentication_status:
                     st.session_state['page'] = 'main'
-                    st.experimental_rerun()  # Make sure to use st.experimental_rerun() instead of st.rerun()
+                    st.rerun()
                 elif authentication_status is False:
                     st.error('Username/password is incorrect')
                 elif authentication_status is None:
@@ -241,13 +334,13 @@ def main():
             
             if st.button("Need an account? Sign Up"):
                 st.session_state['page'] = 'signup'
-                st.experimental_rerun()
+                st.rerun()
         
         elif st.session_state['page'] == 'signup':
             signup()
             if st.button("Back to Login"):
                 st.session_state['page'] = 'login'
-                st.experimental_rerun()
+                st.rerun()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,48 @@
+"""One-off migration of user documents to normalised (stripped, lowercase) IDs.
+
+streamlit-authenticator strips and lowercases usernames before looking them up,
+so users stored under a mixed-case or space-padded document ID can't log in.
+Run this once by hand:
+
+    python migrate_usernames.py          # report what would change
+    python migrate_usernames.py --apply  # perform the renames
+
+IDs that collide once normalised (e.g. 'Alice' and 'ALICE', or 'Alice' and an
+existing 'alice') are reported and left untouched for manual resolution.
+"""
+import argparse
+from collections import defaultdict
+
+from app import get_db, is_valid_username, normalize_username
+
+
+def migrate_usernames(apply=False):
+    db = get_db()
+    users_ref = db.collection('users')
+    groups = defaultdict(list)
+    for doc in users_ref.stream():
+        groups[normalize_username(doc.id)].append(doc)
+
+    for target, docs in sorted(groups.items()):
+        if all(doc.id == target for doc in docs):
+            continue
+        if not is_valid_username(target):
+            print(f"SKIP {docs[0].id!r}: not a valid username once normalised")
+            continue
+        if len(docs) > 1:
+            print(f"SKIP {target}: collides with {', '.join(doc.id for doc in docs)}")
+            continue
+        doc = docs[0]
+        print(f"RENAME {doc.id} -> {target}")
+        if apply:
+            # create() fails if the target appeared since the scan, so nothing is overwritten
+            batch = db.batch()
+            batch.create(users_ref.document(target), {**doc.to_dict(), 'username': target})
+            batch.delete(doc.reference)
+            batch.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--apply', action='store_true', help="perform the renames instead of only reporting them")
+    migrate_usernames(parser.parse_args().apply)
@@ -1,54 +1,133 @@
+import io
 import numpy as np
 import pandas as pd
 import plotly.express as px
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 
-def compute_grade_boundaries(df, grade_labels, grade_centric, manual_boundaries=None):
-    """Compute grade boundaries based on a centric grade or manual overrides."""
+try:
+    from numba import njit, prange
+except ImportError:  # Numba is optional; grading falls back to NumPy
+    njit = None
+
+# Full-frame grading only runs when the graded file is downloaded. Warm, the kernel saves about
+# 11 ms per million rows over np.searchsorted on one core, but its first call in a process costs
+# ~140 ms (on-disk cache) to ~570 ms (cold compile), so it only pays off on very large files
+NUMBA_MIN_ROWS = 10_000_000
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _bucketize_marks(marks, bounds, label_codes, default_code, codes):
+        """Binary-search each mark against the ascending boundaries and write its grade code."""
+        for i in prange(marks.shape[0]):
+            lo, hi = 0, bounds.shape[0]
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if bounds[mid] <= marks[i]:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            codes[i] = label_codes[lo - 1] if lo > 0 else default_code
+
+def compute_auto_boundaries(df, grade_labels, grade_centric):
+    """Compute grade boundaries so the centric grade is the most frequent."""
     total_students = len(df)
     center_idx = grade_labels.index(grade_centric)
     
-    if manual_boundaries:
-        grade_boundaries = manual_boundaries
-    else:
-        distribution = np.array([abs(i - center_idx) for i in range(len(grade_labels))])
-        distribution = np.max(distribution) - distribution + 1
-        distribution = distribution / distribution.sum()
-        
-        grade_counts = (distribution * total_students).astype(int)
-        grade_counts[-1] += total_students - grade_counts.sum()
-        
-        df_sorted = df.sort_values(by='marks', ascending=False).reset_index(drop=True)
-        grade_boundaries = {}
-        start_idx = 0
-        
-        for i, grade in enumerate(grade_labels[:-1]):
-            end_idx = start_idx + grade_counts[i]
-            if end_idx > total_students:
-                end_idx = total_students
-            if start_idx < total_students:
-                grade_boundaries[grade] = df_sorted.iloc[end_idx - 1]['marks']
-            start_idx = end_idx
-        
-        grade_boundaries[grade_labels[-1]] = 0
+    distribution = np.array([abs(i - center_idx) for i in range(len(grade_labels))])
+    distribution = np.max(distribution) - distribution + 1
+    distribution = distribution / distribution.sum()
+    
+    grade_counts = (distribution * total_students).astype(int)
+    grade_counts[-1] += total_students - grade_counts.sum()
     
-    df['grade'] = df['marks'].apply(lambda x: next((g for g, b in grade_boundaries.items() if x >= b), grade_labels[-1]))
-    return df, grade_boundaries
+    # Each boundary is the mark at the end of its grade's slice of the descending ranking
+    end_idx = np.minimum(np.cumsum(grade_counts[:-1]), total_students)
+    start_idx = np.concatenate(([0], end_idx[:-1]))
+    graded = start_idx < total_students
+    positions = (end_idx[graded] - 1) % max(total_students, 1)
+    
+    # Only the boundary order statistics are needed, so partition instead of sorting every row
+    neg_marks = -df['marks'].to_numpy(dtype=float)
+    boundary_marks = -np.partition(neg_marks, positions)[positions] if positions.size else []
+    grade_boundaries = dict(zip([g for g, ok in zip(grade_labels[:-1], graded) if ok], boundary_marks))
+    
+    grade_boundaries[grade_labels[-1]] = 0
+    return grade_boundaries
+
+def grade_codes(marks, grade_labels, grade_boundaries):
+    """Map a marks array to indices into grade_labels."""
+    # The first grade whose boundary is met wins; a running minimum makes the boundaries monotonic
+    # so the reversed (ascending) array can be searched for the highest grade reached
+    label_codes = np.array([grade_labels.index(grade) for grade in grade_boundaries])[::-1]
+    bounds = np.minimum.accumulate(np.array(list(grade_boundaries.values()), dtype=float))[::-1]
+    if njit is not None and len(marks) >= NUMBA_MIN_ROWS:
+        codes = np.empty(len(marks), dtype=np.int64)
+        _bucketize_marks(marks, bounds, label_codes, len(grade_labels) - 1, codes)
+        return codes
+    idx = np.searchsorted(bounds, marks, side='right') - 1
+    return np.where(idx >= 0, label_codes[np.clip(idx, 0, None)], len(grade_labels) - 1)
+
+def apply_boundaries(df, grade_labels, grade_boundaries):
+    """Assign each student the highest grade whose minimum marks they meet."""
+    codes = grade_codes(df['marks'].to_numpy(dtype=float), grade_labels, grade_boundaries)
+    df['grade'] = pd.Categorical.from_codes(codes, categories=grade_labels, ordered=True)
+    return df
 
 def validate_boundaries(grade_labels, boundaries):
     """Ensure grade boundaries are in descending order."""
-    boundary_values = [boundaries[grade] for grade in grade_labels[:-1]]
-    return all(boundary_values[i] > boundary_values[i+1] for i in range(len(boundary_values) - 1))
+    boundary_values = np.fromiter((boundaries[grade] for grade in grade_labels[:-1]),
+                                  dtype=np.float64, count=len(grade_labels) - 1)
+    return bool(np.all(np.diff(boundary_values) < 0))
+
+def compute_statistics(marks):
+    """Summarise the marks using a single describe() pass plus the mode."""
+    desc = marks.describe()
+    mode = marks.mode()
+    return {
+        "Mean": desc['mean'],
+        "Median": desc['50%'],
+        "Mode": mode.values[0] if not mode.empty else "N/A",
+        "Standard Deviation": desc['std'],
+        "Minimum": desc['min'],
+        "Maximum": desc['max'],
+    }
+
+def marks_histogram(marks):
+    """Collapse marks into their distinct values and how often each occurs."""
+    return np.unique(marks.to_numpy(dtype=float), return_counts=True)
 
-def plot_grade_distribution(df, grade_labels):
-    """Plot the distribution of grades using Plotly."""
-    grade_counts = df['grade'].value_counts().reindex(grade_labels, fill_value=0)
+def count_grades(values, counts, grade_labels, grade_boundaries):
+    """Count students per grade from a marks histogram, in grade label order."""
+    codes = grade_codes(values, grade_labels, grade_boundaries)
+    grade_counts = np.bincount(codes, weights=counts, minlength=len(grade_labels)).astype(int)
+    return pd.Series(grade_counts, index=grade_labels)
+
+def plot_grade_distribution(grade_counts, styled=True):
+    """Plot the distribution of grades using Plotly; unstyled bars drop the per-grade colour and labels."""
+    style = {'color': grade_counts.index, 'text': grade_counts.values} if styled else {}
     fig = px.bar(x=grade_counts.index, y=grade_counts.values, 
                  labels={'x': 'Grades', 'y': 'Frequency'},
                  title='Grade Distribution', 
-                 color=grade_counts.index, 
-                 text=grade_counts.values)
+                 **style)
     return fig
 
+def export_csv(df):
+    """Serialise the dataframe to CSV bytes with pyarrow's writer.
+
+    The output differs from df.to_csv in formatting only: strings and headers are quoted,
+    whole-number floats lose their '.0' (85 not 85.0), booleans are lowercase, small floats
+    use a one-digit exponent (1e-7), and datetimes are written in full (2024-01-01 00:00:00.000000).
+    """
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Object columns with mixed types (common in Excel uploads) have no Arrow type
+        return df.to_csv(index=False).encode('utf-8')
+    buf = io.BytesIO()
+    pa_csv.write_csv(table, buf)
+    return buf.getvalue()
+
 def clean_data(df):
     """Clean the dataframe by converting marks to numeric and removing invalid rows."""
     df['marks'] = pd.to_numeric(df['marks'], errors='coerce')